@@ -2,14 +2,17 @@
 
 from __future__ import annotations
 
+import asyncio
+import io
 import json
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 from loguru import logger
 
-from nanobot.utils.helpers import ensure_dir, today_date
+from nanobot.utils.helpers import ensure_dir, json_loads
 
 if TYPE_CHECKING:
     from nanobot.providers.base import LLMProvider
@@ -43,6 +46,34 @@ _SAVE_MEMORY_TOOL = [
 ]
 
 
+# Today's notes beyond this many chars are cut from the front in the agent context
+_TODAY_MAX_CHARS = 16_384
+_TRUNCATION_MARKER = "…[truncated earlier notes]…\n"
+
+# Below this much message text a window is not worth an LLM consolidation call
+_MIN_CONSOLIDATE_CHARS = 200
+
+
+@lru_cache(maxsize=8)
+def _role_label(role: str) -> str:
+    """Upper-cased role name for transcripts (only a handful of distinct roles)."""
+    return role.upper()
+
+
+def _keep_tail(text: str, max_chars: int) -> str:
+    """Keep the last ~max_chars of text, cut at a line boundary, with a marker in front."""
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    # Drop the partial first line, unless the slice already starts on a line
+    # or no complete line would remain after it
+    if text[-max_chars - 1] != "\n":
+        newline = tail.find("\n")
+        if newline != -1 and newline < len(tail) - 1:
+            tail = tail[newline + 1:]
+    return _TRUNCATION_MARKER + tail
+
+
 class MemoryStore:
     """
     File-based memory backend.
@@ -52,11 +83,16 @@ class MemoryStore:
     All methods are async to satisfy the MemoryBackend protocol.
     """
 
-    def __init__(self, workspace: Path):
+    def __init__(self, workspace: Path, today_max_chars: int = _TODAY_MAX_CHARS):
         self.workspace = workspace
+        self.today_max_chars = today_max_chars  # 0 disables truncation
         self.memory_dir = ensure_dir(workspace / "memory")
         self.memory_file = self.memory_dir / "MEMORY.md"
         self.history_file = self.memory_dir / "HISTORY.md"
+        # path -> ((st_mtime_ns, st_size), content); avoids re-reading unchanged files
+        self._cache: dict[Path, tuple[tuple[int, int], str]] = {}
+        # (date, today's file, today's header), recomputed when the date changes
+        self._today_cache: tuple[date, Path, str] | None = None
 
     async def initialize(self) -> None:
         """No-op for file backend."""
@@ -64,84 +100,116 @@ class MemoryStore:
     async def close(self) -> None:
         """No-op for file backend."""
 
+    def _get_today(self) -> tuple[Path, str]:
+        """Get today's memory file and its header, cached for the current day."""
+        today = datetime.now().date()
+        if self._today_cache is None or self._today_cache[0] != today:
+            day = today.strftime("%Y-%m-%d")
+            self._today_cache = (today, self.memory_dir / f"{day}.md", f"# {day}\n\n")
+        return self._today_cache[1], self._today_cache[2]
+
     def _get_today_file(self) -> Path:
         """Get path to today's memory file."""
-        return self.memory_dir / f"{today_date()}.md"
+        return self._get_today()[0]
+
+    @staticmethod
+    def _stamp(path: Path) -> tuple[int, int]:
+        """Change marker for a file: (mtime_ns, size)."""
+        st = path.stat()
+        return st.st_mtime_ns, st.st_size
+
+    def _read_cached(self, path: Path) -> str:
+        """Read a file, reusing the cached content while its stamp is unchanged."""
+        try:
+            stamp = self._stamp(path)
+        except FileNotFoundError:
+            self._cache.pop(path, None)
+            return ""
+        cached = self._cache.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        with open(path, "rb") as f:
+            content = f.read().decode("utf-8")
+        # Match text-mode reads: normalize \r\n and \r line endings
+        if "\r" in content:
+            content = content.replace("\r\n", "\n").replace("\r", "\n")
+        self._cache[path] = (stamp, content)
+        return content
+
+    def _write_cached(self, path: Path, content: str) -> None:
+        """Write a file and refresh its cache entry."""
+        path.write_text(content, encoding="utf-8")
+        self._cache[path] = (self._stamp(path), content)
 
     async def read_today(self) -> str:
         """Read today's memory notes."""
-        today_file = self._get_today_file()
-        if today_file.exists():
-            return today_file.read_text(encoding="utf-8")
-        return ""
+        return await asyncio.to_thread(self._read_cached, self._get_today_file())
 
     async def append_today(self, content: str) -> None:
         """Append content to today's memory notes."""
-        today_file = self._get_today_file()
-
-        if today_file.exists():
-            existing = today_file.read_text(encoding="utf-8")
-            content = existing + "\n" + content
+        today_file, header = self._get_today()
+
+        if not today_file.exists():
+            self._write_cached(today_file, header + content)
+            return
+
+        # Append only the new content; extend the cached copy if it is still current
+        cached = self._cache.get(today_file)
+        fresh = cached is not None and cached[0] == self._stamp(today_file)
+        with open(today_file, "a", encoding="utf-8") as f:
+            f.write("\n" + content)
+        if fresh:
+            self._cache[today_file] = (self._stamp(today_file), cached[1] + "\n" + content)
         else:
-            header = f"# {today_date()}\n\n"
-            content = header + content
-
-        today_file.write_text(content, encoding="utf-8")
+            self._cache.pop(today_file, None)
 
     async def read_long_term(self) -> str:
         """Read long-term memory (MEMORY.md)."""
-        if self.memory_file.exists():
-            return self.memory_file.read_text(encoding="utf-8")
-        return ""
+        return await asyncio.to_thread(self._read_cached, self.memory_file)
 
     async def write_long_term(self, content: str) -> None:
         """Write to long-term memory (MEMORY.md)."""
-        self.memory_file.write_text(content, encoding="utf-8")
+        self._write_cached(self.memory_file, content)
 
     async def get_recent_memories(self, days: int = 7) -> str:
         """Get memories from the last N days."""
-        memories = []
         today = datetime.now().date()
-
-        for i in range(days):
-            date = today - timedelta(days=i)
-            date_str = date.strftime("%Y-%m-%d")
-            file_path = self.memory_dir / f"{date_str}.md"
-
-            if file_path.exists():
-                content = file_path.read_text(encoding="utf-8")
-                memories.append(content)
-
-        return "\n\n---\n\n".join(memories)
+        paths = [
+            self.memory_dir / f"{(today - timedelta(days=i)).strftime('%Y-%m-%d')}.md"
+            for i in range(days)
+        ]
+        results = await asyncio.gather(*(asyncio.to_thread(self._read_cached, p) for p in paths))
+        return "\n\n---\n\n".join(r for r in results if r)
 
     async def get_memory_context(self) -> str:
         """Get memory context for the agent."""
-        parts = []
+        long_term, today = await asyncio.gather(self.read_long_term(), self.read_today())
+        if today:
+            today = _keep_tail(today, self.today_max_chars)
 
-        long_term = await self.read_long_term()
+        if long_term and today:
+            return f"## Long-term Memory\n{long_term}\n\n## Today's Notes\n{today}"
         if long_term:
-            parts.append("## Long-term Memory\n" + long_term)
-
-        today = await self.read_today()
+            return f"## Long-term Memory\n{long_term}"
         if today:
-            parts.append("## Today's Notes\n" + today)
-
-        return "\n\n".join(parts) if parts else ""
+            return f"## Today's Notes\n{today}"
+        return ""
 
     # ---- Legacy consolidation (used by upstream agent loop) ----
 
     def _read_long_term_sync(self) -> str:
-        if self.memory_file.exists():
-            return self.memory_file.read_text(encoding="utf-8")
-        return ""
+        return self._read_cached(self.memory_file)
 
     def _write_long_term_sync(self, content: str) -> None:
-        self.memory_file.write_text(content, encoding="utf-8")
+        self._write_cached(self.memory_file, content)
 
-    def append_history(self, entry: str) -> None:
+    def _append_history_sync(self, entry: str) -> None:
         with open(self.history_file, "a", encoding="utf-8") as f:
             f.write(entry.rstrip() + "\n\n")
 
+    async def append_history(self, entry: str) -> None:
+        await asyncio.to_thread(self._append_history_sync, entry)
+
     async def consolidate(
         self,
         session: Session,
@@ -170,12 +238,30 @@ class MemoryStore:
                 return True
             logger.info("Memory consolidation: {} to consolidate, {} keep", len(old_messages), keep_count)
 
-        lines = []
+        buf = io.StringIO()
+        content_chars = 0
         for m in old_messages:
-            if not m.get("content"):
+            content = m.get("content")
+            if not content:
                 continue
-            tools = f" [tools: {', '.join(m['tools_used'])}]" if m.get("tools_used") else ""
-            lines.append(f"[{m.get('timestamp', '?')[:16]}] {m['role'].upper()}{tools}: {m['content']}")
+            if not isinstance(content, str):
+                content = str(content)
+            content_chars += len(content)
+            tools_used = m.get("tools_used")
+            buf.writelines((
+                "[", m.get("timestamp", "?")[:16], "] ", _role_label(m["role"]),
+                " [tools: " + ", ".join(tools_used) + "]" if tools_used else "",
+                ": ", content, "\n",
+            ))
+
+        # Nothing substantive to remember: advance the offset without an LLM call
+        if content_chars < _MIN_CONSOLIDATE_CHARS:
+            session.last_consolidated = 0 if archive_all else len(session.messages) - keep_count
+            logger.info(
+                "Memory consolidation skipped: {} chars in {} messages, last_consolidated={}",
+                content_chars, len(old_messages), session.last_consolidated,
+            )
+            return True
 
         current_memory = self._read_long_term_sync()
         prompt = f"""Process this conversation and call the save_memory tool with your consolidation.
@@ -184,7 +270,7 @@ class MemoryStore:
 {current_memory or "(empty)"}
 
 ## Conversation to Process
-{chr(10).join(lines)}"""
+{buf.getvalue()}"""
 
         try:
             response = await provider.chat(
@@ -203,7 +289,7 @@ class MemoryStore:
             args = response.tool_calls[0].arguments
             # Some providers return arguments as a JSON string instead of dict
             if isinstance(args, str):
-                args = json.loads(args)
+                args = json_loads(args)
             if not isinstance(args, dict):
                 logger.warning("Memory consolidation: unexpected arguments type {}", type(args).__name__)
                 return False
@@ -211,7 +297,7 @@ class MemoryStore:
             if entry := args.get("history_entry"):
                 if not isinstance(entry, str):
                     entry = json.dumps(entry, ensure_ascii=False)
-                self.append_history(entry)
+                await self.append_history(entry)
             if update := args.get("memory_update"):
                 if not isinstance(update, str):
                     update = json.dumps(update, ensure_ascii=False)
@@ -1,19 +1,25 @@
 """DingTalk/DingDing channel implementation using Stream Mode."""
 
 import asyncio
+import collections
 import json
+import os
+import random
 import time
 import uuid
 from dataclasses import dataclass, field as dc_field
 from typing import Any
+from urllib.parse import quote_plus
 
 from loguru import logger
 import httpx
+import websockets
 
 from nanobot.bus.events import OutboundMessage
 from nanobot.bus.queue import MessageBus
 from nanobot.channels.base import BaseChannel
 from nanobot.config.schema import DingTalkConfig
+from nanobot.utils.helpers import get_data_path, json_dumps
 
 try:
     from dingtalk_stream import (
@@ -38,10 +44,39 @@ except ImportError:
 _DINGTALK_API = "https://api.dingtalk.com"
 _AI_CARD_TEMPLATE_ID = "382e4302-551d-4880-bf29-a30acfab2e71.schema"
 _CARD_TTL_SECONDS = 600  # 10 minutes
+_TOKEN_REFRESH_MARGIN = 300  # renew access token 5 minutes before expiry
+_TOKEN_RETRY_SECONDS = 30
+_CARD_STREAM_INTERVAL = 0.2  # coalesce progress updates into one streaming PUT per interval
+_GUID_BATCH = 256  # streaming guids generated per os.urandom call
+_RECONNECT_MIN_DELAY = 0.5
+_RECONNECT_MAX_DELAY = 60.0
+_RECONNECT_STABLE_SECONDS = 60  # a stream that stayed up this long resets the backoff
 
 # sys_full_json_obj declares which template fields to render
 _SYS_FULL_JSON = json.dumps({"order": ["msgContent"]})
 
+_AUTH_HEADER_NAME = "x-acs-dingtalk-access-token"
+
+# Static parts of request bodies, merged into a fresh dict per call. Scalars
+# only: a shallow merge would otherwise share nested dicts across requests.
+_CARD_CREATE_BODY_BASE: dict[str, Any] = {
+    "cardTemplateId": _AI_CARD_TEMPLATE_ID,
+    "callbackType": "STREAM",
+    "userIdType": 1,
+}
+_CARD_DATA_BASE = {"staticMsgContent": "", "sys_full_json_obj": _SYS_FULL_JSON}
+_STREAM_BODY_BASE = {"key": "msgContent", "isFull": True, "isError": False}
+
+# ai_card metadata key -> inbound callback payload field
+_META_FIELDS = (
+    ("_dingtalk_conversation_type", "conversationType"),
+    ("_dingtalk_conversation_id", "conversationId"),
+    ("_dingtalk_sender_staff_id", "senderStaffId"),
+    ("_dingtalk_sender_id", "senderId"),
+    ("_dingtalk_sender_corp_id", "senderCorpId"),
+    ("_dingtalk_message_id", "msgId"),
+)
+
 
 @dataclass
 class _ActiveCard:
@@ -51,6 +86,8 @@ class _ActiveCard:
     accumulated_content: str = ""
     inputing_started: bool = False
     created_at: float = dc_field(default_factory=time.time)
+    dirty: bool = False  # accumulated_content changed since the last streaming PUT
+    pending_flush: asyncio.Task | None = None
 
 
 class NanobotDingTalkHandler(CallbackHandler):
@@ -66,25 +103,26 @@ class NanobotDingTalkHandler(CallbackHandler):
     async def process(self, message: CallbackMessage):
         """Process incoming stream message."""
         try:
-            # Parse using SDK's ChatbotMessage for robust handling
-            chatbot_msg = ChatbotMessage.from_dict(message.data)
-
-            # Extract text content; fall back to raw dict if SDK object is empty
-            content = ""
-            if chatbot_msg.text:
-                content = chatbot_msg.text.content.strip()
-            if not content:
-                content = message.data.get("text", {}).get("content", "").strip()
+            data = message.data
+            msg_type = data.get("msgtype")
+            if msg_type == "text":
+                # Fast path: plain text needs no SDK object graph
+                content = data.get("text", {}).get("content", "").strip()
+            else:
+                # Other types: parse with SDK's ChatbotMessage, fall back to raw dict
+                chatbot_msg = ChatbotMessage.from_dict(data)
+                msg_type = chatbot_msg.message_type
+                content = chatbot_msg.text.content.strip() if chatbot_msg.text else ""
+                if not content:
+                    content = data.get("text", {}).get("content", "").strip()
 
             if not content:
-                logger.warning(
-                    "Received empty or unsupported message type: {}",
-                    chatbot_msg.message_type,
-                )
+                logger.warning("Received empty or unsupported message type: {}", msg_type)
                 return AckMessage.STATUS_OK, "OK"
 
-            sender_id = chatbot_msg.sender_staff_id or chatbot_msg.sender_id
-            sender_name = chatbot_msg.sender_nick or "Unknown"
+            # Same top-level fields ChatbotMessage copies verbatim
+            sender_id = data.get("senderStaffId") or data.get("senderId")
+            sender_name = data.get("senderNick") or "Unknown"
 
             logger.info("Received DingTalk message from {} ({}): {}", sender_name, sender_id, content)
 
@@ -96,20 +134,12 @@ class NanobotDingTalkHandler(CallbackHandler):
 
             # When ai_card mode is enabled, extract extra fields for card APIs
             if self.channel.config.reply_mode == "ai_card":
-                conv_type = chatbot_msg.conversation_type or message.data.get("conversationType", "")
-                metadata["_dingtalk_conversation_type"] = str(conv_type)
-                metadata["_dingtalk_conversation_id"] = (
-                    chatbot_msg.conversation_id or message.data.get("conversationId", "")
-                )
-                metadata["_dingtalk_sender_staff_id"] = chatbot_msg.sender_staff_id or ""
-                metadata["_dingtalk_sender_id"] = chatbot_msg.sender_id or ""
-                metadata["_dingtalk_sender_corp_id"] = chatbot_msg.sender_corp_id or ""
-                metadata["_dingtalk_message_id"] = chatbot_msg.message_id or message.data.get("msgId", "")
+                metadata.update({key: str(data.get(field) or "") for key, field in _META_FIELDS})
 
             # Determine chat_id: group chats use conversation_id, private chats use sender_id
             conv_type = metadata.get("_dingtalk_conversation_type", "")
             if conv_type == "2":
-                chat_id = chatbot_msg.conversation_id or message.data.get("conversationId", sender_id)
+                chat_id = data.get("conversationId") or sender_id
             else:
                 chat_id = sender_id
 
@@ -159,13 +189,23 @@ class DingTalkChannel(BaseChannel):
         # Access Token management for sending messages
         self._access_token: str | None = None
         self._token_expiry: float = 0
+        self._token_refresh_task: asyncio.Task | None = None
+        self._auth_headers: dict[str, str] = {}
+        self._state_dir = get_data_path() / "dingtalk"
+        self._token_path = self._state_dir / "access_token.json"
 
         # Hold references to background tasks to prevent GC
         self._background_tasks: set[asyncio.Task] = set()
+        # Bound how many inbound frames are being handled at once; the stream
+        # receive loop stops reading from the socket while all slots are taken
+        self._inflight = asyncio.Semaphore(max(1, config.max_concurrent_messages))
 
         # Active AI cards keyed by chat_id
         self._active_cards: dict[str, _ActiveCard] = {}
 
+        # Pre-generated 32-hex-char guids for streaming updates
+        self._guid_pool: collections.deque[str] = collections.deque()
+
     async def start(self) -> None:
         """Start the DingTalk bot with Stream Mode."""
         try:
@@ -180,7 +220,17 @@ class DingTalkChannel(BaseChannel):
                 return
 
             self._running = True
-            self._http = httpx.AsyncClient()
+            # One pooled HTTP/2 client for the channel's lifetime so card steps share a connection
+            self._http = httpx.AsyncClient(
+                base_url=_DINGTALK_API,
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=20),
+                timeout=httpx.Timeout(10.0, connect=3.0),
+            )
+
+            # Reuse a persisted token if still valid, then keep it fresh in the background
+            self._load_token()
+            self._token_refresh_task = asyncio.create_task(self._token_refresh_loop())
 
             logger.info(
                 "Initializing DingTalk Stream Client with Client ID: {}...",
@@ -195,22 +245,62 @@ class DingTalkChannel(BaseChannel):
 
             logger.info("DingTalk bot started with Stream Mode (reply_mode={})", self.config.reply_mode)
 
-            # Reconnect loop: restart stream if SDK exits or crashes
+            # Reconnect loop: one stream session per iteration, with exponential
+            # backoff + jitter while it keeps failing. Sessions are driven here
+            # rather than via the SDK's start(), which retries forever internally
+            # at a fixed cadence and never returns.
+            self._client.pre_start()
+            backoff = _RECONNECT_MIN_DELAY
             while self._running:
+                started = time.monotonic()
                 try:
-                    await self._client.start()
+                    await self._run_stream_session()
                 except Exception as e:
                     logger.warning("DingTalk stream error: {}", e)
-                if self._running:
-                    logger.info("Reconnecting DingTalk stream in 5 seconds...")
-                    await asyncio.sleep(5)
+                if not self._running:
+                    break
+                if time.monotonic() - started >= _RECONNECT_STABLE_SECONDS:
+                    backoff = _RECONNECT_MIN_DELAY
+                delay = backoff + random.uniform(0, backoff)
+                logger.info("Reconnecting DingTalk stream in {:.1f} seconds...", delay)
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, _RECONNECT_MAX_DELAY)
 
         except Exception as e:
             logger.exception("Failed to start DingTalk channel: {}", e)
 
+    async def _run_stream_session(self) -> None:
+        """Open one Stream Mode connection and dispatch frames until it closes."""
+        # open_connection is a blocking HTTP call in the SDK
+        connection = await asyncio.to_thread(self._client.open_connection)
+        if not connection:
+            raise RuntimeError("open connection failed")
+        uri = f"{connection['endpoint']}?ticket={quote_plus(connection['ticket'])}"
+        async with websockets.connect(uri) as websocket:
+            self._client.websocket = websocket
+            keepalive = asyncio.create_task(self._client.keepalive(websocket))
+            try:
+                async for raw_message in websocket:
+                    # Backpressure: wait for a free slot before reading on
+                    await self._inflight.acquire()
+                    try:
+                        # SDK routes the frame to our handler and sends the ack
+                        task = asyncio.create_task(self._client.background_task(json.loads(raw_message)))
+                    except BaseException:
+                        self._inflight.release()
+                        raise
+                    self._background_tasks.add(task)
+                    task.add_done_callback(self._inbound_done)
+            finally:
+                keepalive.cancel()
+                self._client.websocket = None
+
     async def stop(self) -> None:
         """Stop the DingTalk bot."""
         self._running = False
+        # Close the stream socket so the reconnect loop exits
+        if self._client and self._client.websocket:
+            await self._client.websocket.close()
         # Finish all active AI cards before shutdown
         for chat_id, card in list(self._active_cards.items()):
             try:
@@ -218,6 +308,11 @@ class DingTalkChannel(BaseChannel):
             except Exception as e:
                 logger.warning("Failed to finish card for {} on stop: {}", chat_id, e)
         self._active_cards.clear()
+        # Stop token refresh and persist the current token for the next start
+        if self._token_refresh_task:
+            self._token_refresh_task.cancel()
+            self._token_refresh_task = None
+        self._save_token()
         # Close the shared HTTP client
         if self._http:
             await self._http.aclose()
@@ -228,11 +323,21 @@ class DingTalkChannel(BaseChannel):
         self._background_tasks.clear()
 
     async def _get_access_token(self) -> str | None:
-        """Get or refresh Access Token."""
+        """Get the current Access Token (kept fresh by _token_refresh_loop)."""
         if self._access_token and time.time() < self._token_expiry:
             return self._access_token
-
-        url = f"{_DINGTALK_API}/v1.0/oauth2/accessToken"
+        # Not fetched yet, or the refresh loop fell behind (failures, host suspend)
+        return await self._refresh_access_token()
+
+    def _headers(self, token: str) -> dict[str, str]:
+        """JSON + auth headers for `token`, rebuilt only when the token changes."""
+        if self._auth_headers.get(_AUTH_HEADER_NAME) != token:
+            self._auth_headers = {_AUTH_HEADER_NAME: token, "Content-Type": "application/json"}
+        return self._auth_headers
+
+    async def _refresh_access_token(self) -> str | None:
+        """Fetch a new Access Token from DingTalk."""
+        url = "/v1.0/oauth2/accessToken"
         data = {
             "appKey": self.config.client_id,
             "appSecret": self.config.client_secret,
@@ -249,11 +354,59 @@ class DingTalkChannel(BaseChannel):
             self._access_token = res_data.get("accessToken")
             # Expire 60s early to be safe
             self._token_expiry = time.time() + int(res_data.get("expireIn", 7200)) - 60
+            self._save_token()
             return self._access_token
         except Exception as e:
             logger.error("Failed to get DingTalk access token: {}", e)
             return None
 
+    async def _token_refresh_loop(self) -> None:
+        """Renew the Access Token shortly before it expires, off the send path."""
+        while self._running:
+            delay = self._token_expiry - _TOKEN_REFRESH_MARGIN - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if not await self._refresh_access_token():
+                await asyncio.sleep(_TOKEN_RETRY_SECONDS)
+
+    def _load_token(self) -> None:
+        """Load a persisted Access Token if it belongs to this app and has not expired."""
+        if not self._token_path.exists():
+            return
+        try:
+            data = json.loads(self._token_path.read_text("utf-8"))
+        except Exception as e:
+            logger.warning("Failed to read DingTalk token file: {}", e)
+            return
+        if not isinstance(data, dict) or data.get("clientId") != self.config.client_id:
+            return
+        token, expiry = data.get("accessToken"), data.get("expiry")
+        if isinstance(token, str) and isinstance(expiry, (int, float)) and time.time() < expiry:
+            self._access_token = token
+            self._token_expiry = float(expiry)
+            logger.debug("Loaded persisted DingTalk access token")
+
+    def _save_token(self) -> None:
+        """Persist the Access Token atomically (write temp file, then rename)."""
+        if not self._access_token:
+            return
+        try:
+            self._state_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._token_path.with_suffix(".tmp")
+            payload = json.dumps({
+                "clientId": self.config.client_id,
+                "accessToken": self._access_token,
+                "expiry": self._token_expiry,
+            }).encode("utf-8")
+            # Create owner-only from the start so the token is never world-readable
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._token_path)
+        except Exception as e:
+            logger.warning("Failed to save DingTalk token file: {}", e)
+
     # ── Send dispatcher ───────────────────────────────────────────────
 
     async def send(self, msg: OutboundMessage) -> None:
@@ -279,17 +432,17 @@ class DingTalkChannel(BaseChannel):
         if not token:
             return
 
-        url = f"{_DINGTALK_API}/v1.0/robot/oToMessages/batchSend"
-        headers = {"x-acs-dingtalk-access-token": token}
+        url = "/v1.0/robot/oToMessages/batchSend"
+        headers = self._headers(token)
 
         data = {
             "robotCode": self.config.client_id,
             "userIds": [msg.chat_id],
             "msgKey": "sampleMarkdown",
-            "msgParam": json.dumps({
+            "msgParam": json_dumps({
                 "text": msg.content,
                 "title": "Nanobot Reply",
-            }, ensure_ascii=False),
+            }).decode(),
         }
 
         if not self._http:
@@ -297,7 +450,7 @@ class DingTalkChannel(BaseChannel):
             return
 
         try:
-            resp = await self._http.post(url, json=data, headers=headers)
+            resp = await self._http.post(url, content=json_dumps(data), headers=headers)
             if resp.status_code != 200:
                 logger.error("DingTalk send failed: {}", resp.text)
             else:
@@ -332,9 +485,13 @@ class DingTalkChannel(BaseChannel):
                     return
                 self._active_cards[chat_id] = card
 
-            # Accumulate and stream content
+            # Accumulate content; a debounced flush streams it
             card.accumulated_content += msg.content + "\n\n"
-            await self._card_stream(card, card.accumulated_content)
+            card.dirty = True
+            if card.pending_flush is None:
+                card.pending_flush = asyncio.create_task(
+                    self._flush_card_after(card, _CARD_STREAM_INTERVAL)
+                )
 
         else:
             # ── Final message ──
@@ -376,18 +533,16 @@ class DingTalkChannel(BaseChannel):
         open_space_id = self._build_open_space_id(msg.metadata)
         conv_type = msg.metadata.get("_dingtalk_conversation_type", "")
 
-        url = f"{_DINGTALK_API}/v1.0/card/instances/createAndDeliver"
-        headers = {"x-acs-dingtalk-access-token": token}
+        url = "/v1.0/card/instances/createAndDeliver"
+        headers = self._headers(token)
 
         body: dict[str, Any] = {
-            "cardTemplateId": _AI_CARD_TEMPLATE_ID,
+            **_CARD_CREATE_BODY_BASE,
             "outTrackId": card_instance_id,
             "cardData": {"cardParamMap": {}},
-            "callbackType": "STREAM",
             "imGroupOpenSpaceModel": {"supportForward": True},
             "imRobotOpenSpaceModel": {"supportForward": True},
             "openSpaceId": open_space_id,
-            "userIdType": 1,
         }
 
         # Deliver model differs between group and private chat
@@ -397,7 +552,7 @@ class DingTalkChannel(BaseChannel):
             body["imRobotOpenDeliverModel"] = {"spaceType": "IM_ROBOT"}
 
         try:
-            resp = await self._http.post(url, json=body, headers=headers)
+            resp = await self._http.post(url, content=json_dumps(body), headers=headers)
             if resp.status_code != 200:
                 logger.error("DingTalk card create failed ({}): {}", resp.status_code, resp.text)
                 return None
@@ -413,23 +568,18 @@ class DingTalkChannel(BaseChannel):
         if not token or not self._http:
             return
 
-        url = f"{_DINGTALK_API}/v1.0/card/instances"
-        headers = {"x-acs-dingtalk-access-token": token}
-
-        card_param_map: dict[str, str] = {
-            "flowStatus": flow_status,
-            "msgContent": content,
-            "staticMsgContent": "",
-            "sys_full_json_obj": _SYS_FULL_JSON,
-        }
+        url = "/v1.0/card/instances"
+        headers = self._headers(token)
 
         body = {
             "outTrackId": card.card_instance_id,
-            "cardData": {"cardParamMap": card_param_map},
+            "cardData": {
+                "cardParamMap": {**_CARD_DATA_BASE, "flowStatus": flow_status, "msgContent": content},
+            },
         }
 
         try:
-            resp = await self._http.put(url, json=body, headers=headers)
+            resp = await self._http.put(url, content=json_dumps(body), headers=headers)
             if resp.status_code != 200:
                 logger.error("DingTalk card put_data failed ({}): {}", resp.status_code, resp.text)
             else:
@@ -453,21 +603,19 @@ class DingTalkChannel(BaseChannel):
         if not token or not self._http:
             return
 
-        url = f"{_DINGTALK_API}/v1.0/card/streaming"
-        headers = {"x-acs-dingtalk-access-token": token}
+        url = "/v1.0/card/streaming"
+        headers = self._headers(token)
 
         body = {
+            **_STREAM_BODY_BASE,
             "outTrackId": card.card_instance_id,
-            "guid": uuid.uuid4().hex,
-            "key": "msgContent",
+            "guid": self._next_guid(),
             "content": content,
-            "isFull": True,
             "isFinalize": is_finalize,
-            "isError": False,
         }
 
         try:
-            resp = await self._http.put(url, json=body, headers=headers)
+            resp = await self._http.put(url, content=json_dumps(body), headers=headers)
             if resp.status_code != 200:
                 logger.error("DingTalk card streaming failed ({}): {}", resp.status_code, resp.text)
             else:
@@ -475,16 +623,51 @@ class DingTalkChannel(BaseChannel):
         except Exception as e:
             logger.error("Error streaming DingTalk AI card: {}", e)
 
+    def _next_guid(self) -> str:
+        """Pop a random guid, refilling the pool from one os.urandom call when empty."""
+        if not self._guid_pool:
+            raw = os.urandom(16 * _GUID_BATCH).hex()
+            self._guid_pool.extend(raw[i:i + 32] for i in range(0, len(raw), 32))
+        return self._guid_pool.popleft()
+
+    async def _flush_card_after(self, card: _ActiveCard, delay: float) -> None:
+        """Stream the latest accumulated content at most once per `delay` seconds."""
+        try:
+            while True:
+                await asyncio.sleep(delay)
+                if not card.dirty:
+                    return
+                card.dirty = False
+                await self._card_stream(card, card.accumulated_content)
+        finally:
+            card.pending_flush = None
+
     async def _card_finish(self, card: _ActiveCard) -> None:
-        """Step 4+5: Close stream channel (isFinalize=true), then put FINISHED with full content."""
+        """Step 4+5: Close stream channel (isFinalize=true), then put FINISHED with full content.
+
+        The two steps stay sequential: the stream channel is closed before the
+        card is marked FINISHED. A card that never streamed has no channel to
+        close, so it goes straight to FINISHED (no INPUTING/finalize round-trips).
+        """
+        # Drop any pending coalesced update; the final calls carry the full content
+        if card.pending_flush is not None:
+            card.pending_flush.cancel()
+            await asyncio.wait([card.pending_flush])
+        card.dirty = False
         content = card.accumulated_content or "..."
         # Step 4: streaming isFinalize=true to close the stream channel
-        await self._card_stream(card, content, is_finalize=True)
+        if card.inputing_started:
+            await self._card_stream(card, content, is_finalize=True)
         # Step 5: put_card_data with FINISHED status and final content
         await self._card_put_data(card, flow_status="3", content=content)
 
     # ── Message handling ─────────────────────────────────────────────
 
+    def _inbound_done(self, task: asyncio.Task) -> None:
+        """Drop a finished frame task and free its concurrency slot."""
+        self._background_tasks.discard(task)
+        self._inflight.release()
+
     async def _on_message(
         self,
         content: str,
@@ -52,6 +52,7 @@ class DingTalkConfig(Base):
     client_secret: str = ""  # AppSecret
     allow_from: list[str] = Field(default_factory=list)  # Allowed staff_ids
     reply_mode: Literal["text", "ai_card"] = "text"  # "ai_card" enables streaming AI card
+    max_concurrent_messages: int = 32  # Inbound messages handled at once; the rest wait their turn
 
 
 class DiscordConfig(Base):
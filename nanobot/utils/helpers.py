@@ -1,7 +1,14 @@
 """Utility functions for nanobot."""
 
+import json
 from pathlib import Path
 from datetime import datetime
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib encoder
+    orjson = None
 
 def ensure_dir(path: Path) -> Path:
     """Ensure a directory exists, creating it if necessary."""
@@ -52,6 +59,20 @@ def today_date() -> str:
     return datetime.now().strftime("%Y-%m-%d")
 
 
+def json_dumps(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes (non-ASCII kept as-is)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_loads(data: str | bytes) -> Any:
+    """Parse JSON from str or bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 def truncate_string(s: str, max_len: int = 100, suffix: str = "...") -> str:
     """Truncate a string to max length, adding suffix if truncated."""
     if len(s) <= max_len:
@@ -0,0 +1,427 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+import pytest
+import websockets
+from dingtalk_stream import CallbackMessage
+
+from nanobot.bus.events import OutboundMessage
+from nanobot.bus.queue import MessageBus
+from nanobot.channels import dingtalk as dingtalk_module
+from nanobot.channels.dingtalk import DingTalkChannel
+from nanobot.config.schema import DingTalkConfig
+
+
+def _make_config(**kwargs) -> DingTalkConfig:
+    return DingTalkConfig(
+        enabled=True,
+        client_id="app-key",
+        client_secret="app-secret",
+        **kwargs,
+    )
+
+
+def _make_channel(tmp_path: Path, **kwargs) -> DingTalkChannel:
+    channel = DingTalkChannel(_make_config(**kwargs), MessageBus())
+    channel._state_dir = tmp_path
+    channel._token_path = tmp_path / "access_token.json"
+    return channel
+
+
+def test_token_persists_across_instances(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path)
+    channel._access_token = "tok-1"
+    channel._token_expiry = time.time() + 3600
+    channel._save_token()
+
+    restarted = _make_channel(tmp_path)
+    restarted._load_token()
+    assert restarted._access_token == "tok-1"
+    assert restarted._token_expiry == pytest.approx(channel._token_expiry)
+
+
+def test_expired_or_foreign_token_is_ignored(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path)
+    channel._access_token = "tok-old"
+    channel._token_expiry = time.time() - 1
+    channel._save_token()
+
+    restarted = _make_channel(tmp_path)
+    restarted._load_token()
+    assert restarted._access_token is None
+
+    channel._token_expiry = time.time() + 3600
+    channel._save_token()
+    other_app = DingTalkChannel(
+        DingTalkConfig(enabled=True, client_id="other", client_secret="x"), MessageBus()
+    )
+    other_app._token_path = channel._token_path
+    other_app._load_token()
+    assert other_app._access_token is None
+
+
+def test_saved_token_file_is_owner_only(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path)
+    channel._access_token = "tok-1"
+    channel._token_expiry = time.time() + 3600
+    channel._save_token()
+    assert channel._token_path.stat().st_mode & 0o777 == 0o600
+
+
+@pytest.mark.asyncio
+async def test_expired_token_is_refreshed_inline(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path)
+    channel._access_token = "tok-stale"
+    channel._token_expiry = time.time() - 1
+    channel._refresh_access_token = AsyncMock(return_value="tok-new")
+
+    assert await channel._get_access_token() == "tok-new"
+    channel._refresh_access_token.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_get_access_token_uses_cached_token_without_http(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path)
+    channel._access_token = "tok-1"
+    channel._token_expiry = time.time() + 3600
+    # No HTTP client: returning the token must not require a network round-trip
+    assert await channel._get_access_token() == "tok-1"
+
+
+@pytest.mark.asyncio
+async def test_ai_card_progress_updates_are_coalesced(tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.setattr(dingtalk_module, "_CARD_STREAM_INTERVAL", 0.01)
+    channel = _make_channel(tmp_path, reply_mode="ai_card")
+    streamed: list[tuple[str, bool]] = []
+    put_data: list[str] = []
+
+    async def fake_create(msg):
+        return dingtalk_module._ActiveCard(card_instance_id="card_1")
+
+    async def fake_stream(card, content, *, is_finalize=False):
+        card.inputing_started = True
+        streamed.append((content, is_finalize))
+
+    async def fake_put_data(card, flow_status, content=""):
+        put_data.append(flow_status)
+
+    channel._card_create = fake_create
+    channel._card_stream = fake_stream
+    channel._card_put_data = fake_put_data
+
+    meta = {"_dingtalk_conversation_type": "1", "_progress": True}
+    for i in range(5):
+        await channel.send(OutboundMessage(channel="dingtalk", chat_id="u1", content=f"p{i}", metadata=meta))
+    await asyncio.sleep(0.05)
+
+    assert len(streamed) == 1
+    assert streamed[0][0].startswith("p0") and "p4" in streamed[0][0]
+
+    await channel.send(OutboundMessage(
+        channel="dingtalk", chat_id="u1", content="done",
+        metadata={"_dingtalk_conversation_type": "1"},
+    ))
+    assert streamed[-1] == (streamed[0][0] + "done", True)
+    assert put_data == ["3"]
+    assert "u1" not in channel._active_cards
+
+
+class _FakeResponse:
+    status_code = 200
+    text = "ok"
+
+
+class _FakeHttp:
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, str, dict]] = []
+
+    async def post(self, url, **kwargs):
+        self.calls.append(("POST", url, kwargs))
+        return _FakeResponse()
+
+    async def put(self, url, **kwargs):
+        self.calls.append(("PUT", url, kwargs))
+        return _FakeResponse()
+
+
+@pytest.mark.asyncio
+async def test_card_request_bodies(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path, reply_mode="ai_card")
+    channel._access_token = "tok-1"
+    channel._token_expiry = time.time() + 3600
+    channel._http = _FakeHttp()
+    card = dingtalk_module._ActiveCard(card_instance_id="card_1")
+
+    await channel._card_stream(card, "hello", is_finalize=True)
+
+    (_, put_url, put_kwargs), (_, stream_url, stream_kwargs) = channel._http.calls
+    assert put_url == "/v1.0/card/instances"
+    assert put_kwargs["headers"]["x-acs-dingtalk-access-token"] == "tok-1"
+    assert put_kwargs["headers"]["Content-Type"] == "application/json"
+    assert json.loads(put_kwargs["content"])["cardData"]["cardParamMap"]["flowStatus"] == "2"
+
+    body = json.loads(stream_kwargs["content"])
+    assert stream_url == "/v1.0/card/streaming"
+    assert body["outTrackId"] == "card_1"
+    assert body["content"] == "hello"
+    assert body["key"] == "msgContent"
+    assert body["isFull"] is True and body["isFinalize"] is True and body["isError"] is False
+    assert len(body["guid"]) == 32
+
+
+@pytest.mark.asyncio
+async def test_text_send_keeps_non_ascii(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path)
+    channel._access_token = "tok-1"
+    channel._token_expiry = time.time() + 3600
+    channel._http = _FakeHttp()
+
+    await channel.send(OutboundMessage(channel="dingtalk", chat_id="u1", content="你好"))
+
+    (_, url, kwargs), = channel._http.calls
+    assert url == "/v1.0/robot/oToMessages/batchSend"
+    assert "你好".encode() in kwargs["content"]
+    msg_param = json.loads(json.loads(kwargs["content"])["msgParam"])
+    assert msg_param == {"text": "你好", "title": "Nanobot Reply"}
+
+
+def _text_payload(**overrides) -> dict:
+    data = {
+        "msgtype": "text",
+        "text": {"content": "  hello  "},
+        "senderStaffId": "staff1",
+        "senderId": "$:sender1",
+        "senderNick": "Alice",
+        "senderCorpId": "corp1",
+        "conversationType": "1",
+        "conversationId": "cid1",
+        "msgId": "m1",
+    }
+    data.update(overrides)
+    return data
+
+
+@pytest.mark.asyncio
+async def test_handler_text_message_metadata(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path, reply_mode="ai_card")
+    channel._on_message = AsyncMock()
+    handler = dingtalk_module.NanobotDingTalkHandler(channel)
+
+    msg = CallbackMessage()
+    msg.data = _text_payload(conversationType="2")
+    await handler.process(msg)
+    await asyncio.sleep(0)
+
+    channel._on_message.assert_awaited_once()
+    args, kwargs = channel._on_message.call_args
+    assert args == ("hello", "staff1", "Alice")
+    assert kwargs["chat_id"] == "cid1"
+    assert kwargs["metadata"] == {
+        "sender_name": "Alice",
+        "platform": "dingtalk",
+        "_dingtalk_conversation_type": "2",
+        "_dingtalk_conversation_id": "cid1",
+        "_dingtalk_sender_staff_id": "staff1",
+        "_dingtalk_sender_id": "$:sender1",
+        "_dingtalk_sender_corp_id": "corp1",
+        "_dingtalk_message_id": "m1",
+    }
+
+
+@pytest.mark.asyncio
+async def test_handler_skips_non_text_message(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path)
+    channel._on_message = AsyncMock()
+    handler = dingtalk_module.NanobotDingTalkHandler(channel)
+
+    msg = CallbackMessage()
+    msg.data = _text_payload(msgtype="picture", content={"downloadCode": "x"})
+    del msg.data["text"]
+    await handler.process(msg)
+    await asyncio.sleep(0)
+
+    channel._on_message.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_stream_frames_are_bounded(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path, max_concurrent_messages=2)
+    release = asyncio.Event()
+    active = 0
+    peak = 0
+    handled: list[str] = []
+
+    async def serve(ws):
+        for i in range(5):
+            await ws.send(json.dumps({"type": "CALLBACK", "data": str(i)}))
+        await ws.wait_closed()
+
+    async with websockets.serve(serve, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+
+        class _Client:
+            websocket = None
+
+            def open_connection(self):
+                return {"endpoint": f"ws://127.0.0.1:{port}/", "ticket": "t"}
+
+            async def keepalive(self, ws):
+                await asyncio.sleep(3600)
+
+            async def background_task(self, message):
+                nonlocal active, peak
+                active += 1
+                peak = max(peak, active)
+                await release.wait()
+                handled.append(message["data"])
+                active -= 1
+
+        channel._client = _Client()
+        session = asyncio.create_task(channel._run_stream_session())
+        await asyncio.sleep(0.1)
+        # Only two frame tasks exist; the rest stay unread on the socket
+        assert len(channel._background_tasks) == 2
+        assert channel._inflight.locked()
+
+        release.set()
+        while len(handled) < 5:
+            await asyncio.sleep(0.01)
+        await channel._client.websocket.close()
+        await asyncio.wait_for(session, timeout=5)
+
+    await asyncio.sleep(0)
+    assert peak == 2
+    assert sorted(handled) == ["0", "1", "2", "3", "4"]
+    assert not channel._background_tasks
+    assert channel._inflight._value == 2
+
+
+def test_stream_guids_are_unique_hex(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path)
+    guids = [channel._next_guid() for _ in range(dingtalk_module._GUID_BATCH * 2 + 1)]
+    assert len(set(guids)) == len(guids)
+    assert all(len(g) == 32 and int(g, 16) >= 0 for g in guids)
+
+
+@pytest.mark.asyncio
+async def test_reconnect_backoff_grows_with_jitter(tmp_path: Path, monkeypatch) -> None:
+    channel = _make_channel(tmp_path)
+    delays: list[float] = []
+    attempts = 0
+
+    class _FailingClient:
+        websocket = None
+
+        def __init__(self, credential):
+            pass
+
+        def register_callback_handler(self, topic, handler):
+            pass
+
+        def pre_start(self):
+            pass
+
+        def open_connection(self):
+            # The real SDK logs and returns None when the gateway request fails
+            nonlocal attempts
+            attempts += 1
+            return None
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+        if len(delays) == 9:
+            channel._running = False
+
+    async def idle_refresh():
+        return None
+
+    monkeypatch.setattr(dingtalk_module, "DingTalkStreamClient", _FailingClient)
+    monkeypatch.setattr(dingtalk_module.asyncio, "sleep", fake_sleep)
+    channel._token_refresh_loop = idle_refresh
+
+    await channel.start()
+    await channel._http.aclose()
+
+    assert attempts == 9
+    for i, delay in enumerate(delays):
+        base = min(0.5 * 2**i, 60.0)
+        assert base <= delay <= 2 * base
+    assert delays[-1] >= 60.0
+
+
+@pytest.mark.asyncio
+async def test_one_shot_ai_card_reply_skips_stream_finalize(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path, reply_mode="ai_card")
+    channel._access_token = "tok-1"
+    channel._token_expiry = time.time() + 3600
+    channel._http = _FakeHttp()
+
+    await channel.send(OutboundMessage(
+        channel="dingtalk", chat_id="u1", content="answer",
+        metadata={"_dingtalk_conversation_type": "1", "_dingtalk_sender_staff_id": "staff1"},
+    ))
+
+    create, finished = channel._http.calls
+    assert create[1] == "/v1.0/card/instances/createAndDeliver"
+    assert json.loads(create[2]["content"]) == {
+        "cardTemplateId": dingtalk_module._AI_CARD_TEMPLATE_ID,
+        "outTrackId": json.loads(finished[2]["content"])["outTrackId"],
+        "cardData": {"cardParamMap": {}},
+        "callbackType": "STREAM",
+        "imGroupOpenSpaceModel": {"supportForward": True},
+        "imRobotOpenSpaceModel": {"supportForward": True},
+        "openSpaceId": "dtv1.card//IM_ROBOT.staff1",
+        "userIdType": 1,
+        "imRobotOpenDeliverModel": {"spaceType": "IM_ROBOT"},
+    }
+    assert finished[1] == "/v1.0/card/instances"
+    param_map = json.loads(finished[2]["content"])["cardData"]["cardParamMap"]
+    assert param_map["flowStatus"] == "3" and param_map["msgContent"] == "answer"
+
+
+@pytest.mark.asyncio
+async def test_stream_session_dispatches_frames_until_close(tmp_path: Path) -> None:
+    channel = _make_channel(tmp_path)
+    frames: list[dict] = []
+    seen_paths: list[str] = []
+
+    async def serve(ws):
+        seen_paths.append(ws.request.path)
+        await ws.send(json.dumps({"type": "CALLBACK", "data": "1"}))
+        await ws.send(json.dumps({"type": "CALLBACK", "data": "2"}))
+        await ws.close()
+
+    async with websockets.serve(serve, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+
+        class _Client:
+            websocket = None
+
+            def open_connection(self):
+                return {"endpoint": f"ws://127.0.0.1:{port}/gw", "ticket": "a b"}
+
+            async def keepalive(self, ws):
+                await asyncio.sleep(3600)
+
+            async def background_task(self, message):
+                frames.append(message)
+
+        channel._client = _Client()
+        await asyncio.wait_for(channel._run_stream_session(), timeout=5)
+        await asyncio.sleep(0)
+
+    assert seen_paths == ["/gw?ticket=a+b"]
+    assert [f["data"] for f in frames] == ["1", "2"]
+    assert channel._client.websocket is None
+
+
+def test_body_templates_hold_no_shared_containers() -> None:
+    for template in (
+        dingtalk_module._CARD_CREATE_BODY_BASE,
+        dingtalk_module._CARD_DATA_BASE,
+        dingtalk_module._STREAM_BODY_BASE,
+    ):
+        assert all(isinstance(v, (str, int, bool)) for v in template.values())
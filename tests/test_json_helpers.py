@@ -0,0 +1,39 @@
+"""Test json_dumps/json_loads with and without the optional orjson speedup."""
+
+import json
+
+import pytest
+
+from nanobot.utils import helpers
+
+_PAYLOAD = {"text": "你好, DingTalk", "n": 3, "ok": True, "items": ["a", None]}
+
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def backend(request, monkeypatch):
+    if request.param == "orjson":
+        if helpers.orjson is None:
+            pytest.skip("orjson not installed")
+    else:
+        monkeypatch.setattr(helpers, "orjson", None)
+    return request.param
+
+
+def test_json_dumps_compact_utf8(backend) -> None:
+    data = helpers.json_dumps(_PAYLOAD)
+    assert isinstance(data, bytes)
+    assert "你好".encode("utf-8") in data
+    assert b"\\u" not in data
+    assert json.loads(data) == _PAYLOAD
+    assert helpers.json_dumps({"a": 1, "b": [1, 2]}) == b'{"a":1,"b":[1,2]}'
+
+
+def test_json_loads_str_and_bytes(backend) -> None:
+    text = json.dumps(_PAYLOAD, ensure_ascii=False)
+    assert helpers.json_loads(text) == _PAYLOAD
+    assert helpers.json_loads(text.encode("utf-8")) == _PAYLOAD
+
+
+def test_json_loads_rejects_invalid(backend) -> None:
+    with pytest.raises(ValueError):
+        helpers.json_loads("{not json")
@@ -19,7 +19,7 @@ def _make_session(message_count: int = 30, memory_window: int = 50):
     """Create a mock session with messages."""
     session = MagicMock()
     session.messages = [
-        {"role": "user", "content": f"msg{i}", "timestamp": "2026-01-01 00:00"}
+        {"role": "user", "content": f"msg{i}: let's keep testing the memory system", "timestamp": "2026-01-01 00:00"}
         for i in range(message_count)
     ]
     session.last_consolidated = 0
@@ -145,3 +145,63 @@ class TestMemoryConsolidationTypeHandling:
 
         assert result is True
         provider.chat.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_prompt_transcript_format(self, tmp_path: Path) -> None:
+        """Each consolidated message is rendered as one transcript line."""
+        store = MemoryStore(tmp_path)
+        provider = AsyncMock()
+        provider.chat = AsyncMock(return_value=LLMResponse(content="", tool_calls=[]))
+        session = _make_session(message_count=60)
+        session.messages[0] = {
+            "role": "assistant",
+            "content": "done",
+            "timestamp": "2026-01-01T10:20:30.123",
+            "tools_used": ["read_file", "exec"],
+        }
+        session.messages[1] = {"role": "user", "content": ""}
+
+        await store.consolidate(session, provider, "test-model", memory_window=50)
+
+        prompt = provider.chat.call_args.kwargs["messages"][1]["content"]
+        assert "[2026-01-01T10:20] ASSISTANT [tools: read_file, exec]: done\n" in prompt
+        assert "[2026-01-01 00:00] USER: msg2: let's keep testing the memory system\n" in prompt
+        assert "USER: msg1:" not in prompt
+
+    @pytest.mark.asyncio
+    async def test_short_window_skips_llm(self, tmp_path: Path) -> None:
+        """A window with too little text advances the offset without calling the LLM."""
+        store = MemoryStore(tmp_path)
+        provider = AsyncMock()
+        provider.chat = AsyncMock()
+        session = _make_session(message_count=60)
+        for i, m in enumerate(session.messages):
+            m["content"] = "ok" if i % 2 else "hi"
+
+        result = await store.consolidate(session, provider, "test-model", memory_window=50)
+
+        assert result is True
+        provider.chat.assert_not_called()
+        assert session.last_consolidated == 35
+        assert not store.memory_file.exists()
+        assert not store.history_file.exists()
+
+    @pytest.mark.asyncio
+    async def test_unchanged_memory_is_not_rewritten(self, tmp_path: Path) -> None:
+        """An identical memory_update leaves MEMORY.md untouched."""
+        store = MemoryStore(tmp_path)
+        store.memory_file.write_text("# Memory\nUser likes testing.", encoding="utf-8")
+        provider = AsyncMock()
+        provider.chat = AsyncMock(
+            return_value=_make_tool_response(
+                history_entry="[2026-01-01] Nothing new.",
+                memory_update="# Memory\nUser likes testing.",
+            )
+        )
+        session = _make_session(message_count=60)
+        store._write_long_term_sync = MagicMock()
+
+        result = await store.consolidate(session, provider, "test-model", memory_window=50)
+
+        assert result is True
+        store._write_long_term_sync.assert_not_called()
@@ -0,0 +1,154 @@
+"""Test MemoryStore file reads/writes and the in-process content cache."""
+
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+import nanobot.agent.memory as memory_module
+from nanobot.agent.memory import MemoryStore
+
+
+class TestMemoryStoreCache:
+    """Cached reads must stay consistent with what is on disk."""
+
+    @pytest.mark.asyncio
+    async def test_read_missing_files_returns_empty(self, tmp_path: Path) -> None:
+        store = MemoryStore(tmp_path)
+        assert await store.read_long_term() == ""
+        assert await store.read_today() == ""
+        assert await store.get_memory_context() == ""
+
+    @pytest.mark.asyncio
+    async def test_write_then_read_hits_cache(self, tmp_path: Path) -> None:
+        store = MemoryStore(tmp_path)
+        await store.write_long_term("# Memory\nfact")
+        assert store.memory_file in store._cache
+        assert await store.read_long_term() == "# Memory\nfact"
+
+    @pytest.mark.asyncio
+    async def test_external_edit_invalidates_cache(self, tmp_path: Path) -> None:
+        store = MemoryStore(tmp_path)
+        await store.write_long_term("old")
+        assert await store.read_long_term() == "old"
+
+        store.memory_file.write_text("new content", encoding="utf-8")
+        st = store.memory_file.stat()
+        os.utime(store.memory_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        assert await store.read_long_term() == "new content"
+
+    @pytest.mark.asyncio
+    async def test_deleted_file_drops_cache_entry(self, tmp_path: Path) -> None:
+        store = MemoryStore(tmp_path)
+        await store.write_long_term("fact")
+        store.memory_file.unlink()
+        assert await store.read_long_term() == ""
+        assert store.memory_file not in store._cache
+
+    @pytest.mark.asyncio
+    async def test_append_today_accumulates(self, tmp_path: Path) -> None:
+        store = MemoryStore(tmp_path)
+        await store.append_today("first")
+        await store.append_today("second")
+        today = await store.read_today()
+        assert today.endswith("first\nsecond")
+        assert today == store._get_today_file().read_text(encoding="utf-8")
+
+    @pytest.mark.asyncio
+    async def test_recent_memories_newest_first(self, tmp_path: Path) -> None:
+        store = MemoryStore(tmp_path)
+        today = datetime.now().date()
+        for i, text in enumerate(["today", "yesterday", "two days ago"]):
+            day = (today - timedelta(days=i)).strftime("%Y-%m-%d")
+            (store.memory_dir / f"{day}.md").write_text(text, encoding="utf-8")
+
+        assert await store.get_recent_memories(days=2) == "today\n\n---\n\nyesterday"
+
+    @pytest.mark.asyncio
+    async def test_append_today_uses_append_mode(self, tmp_path: Path) -> None:
+        store = MemoryStore(tmp_path)
+        await store.append_today("first")
+        today_file = store._get_today_file()
+        # Content written behind the store's back must survive the next append
+        with open(today_file, "a", encoding="utf-8") as f:
+            f.write("\nexternal")
+        await store.append_today("second")
+        assert today_file.read_text(encoding="utf-8").endswith("first\nexternal\nsecond")
+        assert await store.read_today() == today_file.read_text(encoding="utf-8")
+
+    @pytest.mark.asyncio
+    async def test_today_file_follows_date_change(self, tmp_path: Path, monkeypatch) -> None:
+        store = MemoryStore(tmp_path)
+        day1 = datetime(2026, 3, 1, 23, 59)
+
+        class _Clock(datetime):
+            now_value = day1
+
+            @classmethod
+            def now(cls, tz=None):
+                return cls.now_value
+
+        monkeypatch.setattr(memory_module, "datetime", _Clock)
+        await store.append_today("late note")
+        assert store._get_today_file().name == "2026-03-01.md"
+
+        _Clock.now_value = day1 + timedelta(minutes=2)
+        await store.append_today("early note")
+        day2_file = store._get_today_file()
+        assert day2_file.name == "2026-03-02.md"
+        assert day2_file.read_text(encoding="utf-8") == "# 2026-03-02\n\nearly note"
+
+    @pytest.mark.asyncio
+    async def test_large_and_crlf_files_read_like_text_mode(self, tmp_path: Path) -> None:
+        store = MemoryStore(tmp_path)
+        big = "记忆 line\n" * 20_000
+        store.memory_file.write_bytes(big.encode("utf-8"))
+        assert await store.read_long_term() == big
+
+        store.memory_file.write_bytes(b"a\r\nb\rc\n")
+        assert await store.read_long_term() == "a\nb\nc\n"
+
+    @pytest.mark.asyncio
+    async def test_memory_context_truncates_long_today_notes(self, tmp_path: Path) -> None:
+        store = MemoryStore(tmp_path, today_max_chars=30)
+        await store.write_long_term("long-term " * 10)
+        for i in range(10):
+            await store.append_today(f"note {i}")
+
+        context = await store.get_memory_context()
+        assert context.startswith("## Long-term Memory\n" + "long-term " * 10)
+        today_part = context.split("## Today's Notes\n", 1)[1]
+        assert today_part.startswith("…[truncated earlier notes]…\nnote ")
+        assert today_part.endswith("note 8\nnote 9")
+        assert "note 0" not in today_part
+        # Direct reads are not truncated
+        assert "note 0" in await store.read_today()
+
+    @pytest.mark.asyncio
+    async def test_memory_context_sections(self, tmp_path: Path) -> None:
+        store = MemoryStore(tmp_path)
+        await store.write_long_term("fact")
+        assert await store.get_memory_context() == "## Long-term Memory\nfact"
+
+        await store.append_today("note")
+        today = await store.read_today()
+        assert await store.get_memory_context() == (
+            f"## Long-term Memory\nfact\n\n## Today's Notes\n{today}"
+        )
+
+        store.memory_file.unlink()
+        assert await store.get_memory_context() == f"## Today's Notes\n{today}"
+
+    def test_keep_tail_line_boundaries(self) -> None:
+        text = "aaaa\nbbbb\ncccc"
+        # Slice starts exactly at a line: keep that whole line
+        assert memory_module._keep_tail(text, 9) == "…[truncated earlier notes]…\nbbbb\ncccc"
+        # Slice starts mid-line: drop the partial line
+        assert memory_module._keep_tail(text, 8) == "…[truncated earlier notes]…\ncccc"
+        assert memory_module._keep_tail(text, len(text)) == text
+        # Only newline is the last char: keep the raw tail rather than just the marker
+        long_line = "# 2026\n\n" + "x" * 20000 + "\n"
+        assert memory_module._keep_tail(long_line, 16384) == (
+            "…[truncated earlier notes]…\n" + long_line[-16384:]
+        )